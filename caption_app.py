@@ -12,8 +12,30 @@ import tkinter as tk
 from tkinter import scrolledtext, font
 import time
 import os
+import re
+import collections
+import itertools
+import concurrent.futures
 from anthropic import Anthropic
 
+CLAUDE_MODEL = "claude-haiku-4-5"
+CORRECTION_PROMPT = ("Please correct any transcription errors in the user's text "
+                     "and return only the corrected version.")
+# Only phrases at least this long and below this recognition confidence go to Claude
+CLAUDE_MIN_WORDS = 4
+CLAUDE_MAX_CONFIDENCE = 0.9
+
+# Recent Claude corrections are reused for repeated or near-identical phrases
+CORRECTION_CACHE_SIZE = 200
+CORRECTION_CACHE_TTL = 300  # seconds
+FILLER_WORDS = {'uh', 'um', 'er', 'ah', 'hmm', 'mm'}
+
+
+def normalize_transcript(text):
+    """Reduce a transcript to a cache key ignoring case, punctuation and filler words"""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
 
 class CaptionApp:
     def __init__(self):
@@ -26,16 +48,26 @@ class CaptionApp:
         self.recognizer = sr.Recognizer()
         self.microphone = sr.Microphone()
         
-        # Thread-safe queue for communication
+        # Thread-safe queue for communication, carrying
+        # ("caption", id, text) and ("replace", id, text) messages
         self.text_queue = queue.Queue()
+        self.caption_ids = itertools.count()
         
         self.claude_client = None
         self.use_claude = False
+        self.correction_cache = collections.OrderedDict()  # key -> (time, text)
+        self.correction_lock = threading.Lock()
+        # Claude corrections run off the audio thread so raw captions show immediately
+        self.claude_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
         self.setup_gui()
         
-        # Audio processing thread
+        # Background listener (keeps the microphone open between phrases)
+        # and the worker that recognizes each captured phrase. A single worker
+        # keeps captions in the order they were spoken while still keeping a
+        # slow recognition from blocking the listener.
         self.is_running = False
-        self.audio_thread = None
+        self.stop_listening = None
+        self.recognition_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         
         # Adjust for ambient noise
         self.calibrate_microphone()
@@ -98,7 +130,8 @@ class CaptionApp:
         )
         self.status_label.pack(side=tk.RIGHT, padx=5)
         
-        self.update_gui()
+        # Worker threads signal new queue items instead of the GUI polling
+        self.root.bind('<<NewCaption>>', self.update_gui)
         
     def calibrate_microphone(self):
         """Calibrate microphone for ambient noise"""
@@ -120,12 +153,17 @@ class CaptionApp:
         self.start_button.config(text="Stop Captioning", bg='#e74c3c')
         self.status_label.config(text="Listening...")
         
-        self.audio_thread = threading.Thread(target=self.process_audio, daemon=True)
-        self.audio_thread.start()
+        # A fresh source, since a previous listener may still be closing its stream
+        self.microphone = sr.Microphone()
+        self.stop_listening = self.recognizer.listen_in_background(
+            self.microphone, self.process_audio, phrase_time_limit=5)
         
     def stop_captioning(self):
         """Stop the captioning process"""
         self.is_running = False
+        if self.stop_listening:
+            self.stop_listening(wait_for_stop=False)
+            self.stop_listening = None
         self.start_button.config(text="Start Captioning", bg='#2ecc71')
         self.status_label.config(text="Stopped")
         
@@ -133,72 +171,118 @@ class CaptionApp:
         """Clear all captions"""
         self.caption_text.delete(1.0, tk.END)
         
-    def process_audio(self):
-        """Process audio in separate thread"""
-        while self.is_running:
-            try:
-                with self.microphone as source:
-                    # Listen for audio with timeout
-                    audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=5)
-                    
-                # Recognize speech using Google's free API
-                try:
-                    text = self.recognizer.recognize_google(audio)
-                    
-                    # Enhance with Claude if available
-                    if self.use_claude and self.claude_client:
-                        enhanced_text = self.enhance_with_claude(text)
-                        if enhanced_text:
-                            text = enhanced_text
-                    
-                    # Put text in queue for GUI update
-                    self.text_queue.put(text)
-                    
-                except sr.UnknownValueError:
-                    # Speech was unintelligible
-                    pass
-                except sr.RequestError as e:
-                    # API error
-                    self.text_queue.put(f"API Error: {e}")
-                    
-            except sr.WaitTimeoutError:
-                # Timeout, continue listening
-                pass
-            except Exception as e:
-                # Other errors
-                self.text_queue.put(f"Error: {e}")
+    def process_audio(self, recognizer, audio):
+        """Hand each captured phrase to the recognition worker"""
+        # Called on the listener thread, which must get back to listening quickly
+        if self.is_running:
+            self.recognition_executor.submit(self.recognize_audio, audio)
+            
+    def recognize_audio(self, audio):
+        """Recognize a captured phrase in a worker thread"""
+        # Recognize speech using Google's free API, keeping its confidence score
+        try:
+            result = self.recognizer.recognize_google(audio, show_all=True)
+            best = max(result['alternative'], key=lambda alt: alt.get('confidence', 0.0))
+            text = best['transcript']
+            confidence = best.get('confidence', 0.0)
+            
+            # Show the raw transcript right away
+            caption_id = self.post_caption(text)
+            
+            # Enhance with Claude if available, patching the caption when done.
+            # Short or confidently recognized phrases are rarely wrong, so skip those.
+            if (self.use_claude and self.claude_client
+                    and len(text.split()) >= CLAUDE_MIN_WORDS
+                    and confidence < CLAUDE_MAX_CONFIDENCE):
+                self.claude_executor.submit(self.correct_caption, caption_id, text)
+            
+        except sr.UnknownValueError:
+            # Speech was unintelligible
+            pass
+        except sr.RequestError as e:
+            # API error
+            self.post_caption(f"API Error: {e}")
+        except Exception as e:
+            # Other errors
+            self.post_caption(f"Error: {e}")
+                
+    def post_caption(self, text):
+        """Queue a new caption for display and return its id"""
+        caption_id = next(self.caption_ids)
+        self.queue_update(("caption", caption_id, text))
+        return caption_id
+        
+    def correct_caption(self, caption_id, text):
+        """Replace a displayed caption with Claude's correction"""
+        enhanced_text = self.enhance_with_claude(text)
+        if enhanced_text and enhanced_text != text:
+            self.queue_update(("replace", caption_id, enhanced_text))
+        
+    def queue_update(self, message):
+        """Queue a GUI update and wake the Tk mainloop to apply it"""
+        self.text_queue.put(message)
+        try:
+            self.root.event_generate('<<NewCaption>>', when='tail')
+        except (RuntimeError, tk.TclError):
+            # Window is closing; nothing left to update
+            pass
                 
     def enhance_with_claude(self, text):
         """Enhance transcription using Claude API"""
+        key = normalize_transcript(text)
+        with self.correction_lock:
+            cached = self.correction_cache.get(key)
+            if cached and time.time() - cached[0] < CORRECTION_CACHE_TTL:
+                self.correction_cache.move_to_end(key)
+                return cached[1]
+            
         try:
-            message = self.claude_client.messages.create(
-                model="claude-haiku-4-5-20250214",
+            with self.claude_client.messages.stream(
+                model=CLAUDE_MODEL,
                 max_tokens=100,
+                # The fixed instruction is a stable prefix Claude can cache across calls
+                system=[{
+                    "type": "text",
+                    "text": CORRECTION_PROMPT,
+                    "cache_control": {"type": "ephemeral"}
+                }],
                 messages=[{
                     "role": "user",
-                    "content": f"Please correct any transcription errors in this text and return only the corrected version: {text}"
+                    "content": text
                 }]
-            )
-            return message.content[0].text.strip()
+            ) as stream:
+                corrected = stream.get_final_text().strip()
         except Exception as e:
             print(f"Claude API error: {e}")
             return text
             
-    def update_gui(self):
+        with self.correction_lock:
+            self.correction_cache[key] = (time.time(), corrected)
+            self.correction_cache.move_to_end(key)
+            if len(self.correction_cache) > CORRECTION_CACHE_SIZE:
+                self.correction_cache.popitem(last=False)
+        return corrected
+            
+    def update_gui(self, event=None):
         """Update GUI from queue"""
         try:
             while True:
-                text = self.text_queue.get_nowait()
+                action, caption_id, text = self.text_queue.get_nowait()
+                # Each caption's text is tagged so a correction can replace it in place
+                tag = f"caption-{caption_id}"
+                if action == "replace":
+                    ranges = self.caption_text.tag_ranges(tag)
+                    if ranges:
+                        self.caption_text.delete(ranges[0], ranges[1])
+                        self.caption_text.insert(ranges[0], text, tag)
+                    continue
                 # Add timestamp and text to caption display
                 timestamp = time.strftime("%H:%M:%S")
-                self.caption_text.insert(tk.END, f"[{timestamp}] {text}\n\n")
+                self.caption_text.insert(tk.END, f"[{timestamp}] ", (), text, tag, "\n\n", ())
                 self.caption_text.see(tk.END)
         except queue.Empty:
             pass
         
-        # Schedule next update
-        self.root.after(100, self.update_gui)
-        
     def setup_claude(self, api_key):
         """Setup Claude API client"""
         try:
@@ -7,16 +7,17 @@ Speaker labels are added with a slight delay via batch processing.
 
 import os
 import sys
-import json
-import tempfile
 import threading
 import queue
 import time
 import wave
 import io
 import pyaudio
+import numpy as np
 from google.cloud import speech
-from flask import Flask, render_template_string
+from google.oauth2 import service_account
+from flask import Flask
+from jinja2 import Template
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
 
@@ -24,7 +25,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 def setup_google_credentials():
-    """Create credentials file from environment variables"""
+    """Build service account credentials from environment variables"""
     project_id = os.getenv('GOOGLE_PROJECT_ID')
     private_key = os.getenv('GOOGLE_PRIVATE_KEY')
     client_email = os.getenv('GOOGLE_CLIENT_EMAIL')
@@ -38,49 +39,102 @@ def setup_google_credentials():
             "token_uri": "https://oauth2.googleapis.com/token"
         }
         
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-        json.dump(creds, temp_file)
-        temp_file.close()
-        
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = temp_file.name
+        credentials = service_account.Credentials.from_service_account_info(creds)
         print("Google credentials loaded from environment variables")
-        return True
+        return credentials
     
     print("Warning: Google Cloud credentials not found in .env")
-    return False
+    return None
 
-# Setup credentials before importing speech client
-setup_google_credentials()
+# Credentials for the Speech client; None falls back to the default lookup
+# (e.g. GOOGLE_APPLICATION_CREDENTIALS)
+GOOGLE_CREDENTIALS = setup_google_credentials()
 
 # Audio recording parameters
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms chunks
-GAIN = 3.0  # Audio amplification factor (increase for distant speakers)
+DIARIZATION_WINDOW = 50  # seconds of most recent audio kept for diarization
+DIARIZATION_MIN_AUDIO = 10  # seconds of new audio needed for good diarization
+DIARIZATION_OVERLAP = 2  # seconds re-sent from the previous slice to align speakers
+INTERIM_INTERVAL = 0.1  # minimum seconds between interim caption emits
+# Audio amplification factor (increase for distant speakers, 1.0 disables it)
+GAIN = float(os.getenv('AUDIO_GAIN', '3.0'))
+
+def amplify_audio(audio_data, gain=GAIN, scratch=None, out=None):
+    """Amplify 16-bit audio data by a gain factor, optionally into preallocated arrays"""
+    samples = np.frombuffer(audio_data, dtype=np.int16)
+    n = len(samples)
+    scratch = np.empty(n, dtype=np.int32) if scratch is None else scratch[:n]
+    out = np.empty(n, dtype=np.int16) if out is None else out[:n]
+    # Widen to int32 so the multiply can't overflow, using a Q8 fixed-point gain
+    np.multiply(samples, int(gain * 256), out=scratch, dtype=np.int32)
+    np.right_shift(scratch, 8, out=scratch)
+    # Clip to 16-bit range
+    np.clip(scratch, -32768, 32767, out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out.tobytes()
 
-import struct
+def match_speakers(transcripts, words):
+    """Pick the majority speaker of the words falling inside each transcript's time span"""
+    # Both transcripts and (start_seconds, speaker) words are in time order,
+    # so a single linear merge assigns every word to at most one transcript
+    speakers = {}
+    wi = 0
+    for item in transcripts:
+        while wi < len(words) and words[wi][0] < item['start']:
+            wi += 1
+        speaker_votes = {}
+        while wi < len(words) and words[wi][0] < item['end']:
+            speaker = words[wi][1]
+            speaker_votes[speaker] = speaker_votes.get(speaker, 0) + 1
+            wi += 1
+        if speaker_votes:
+            speakers[item['id']] = max(speaker_votes, key=speaker_votes.get)
+    return speakers
 
-def amplify_audio(audio_data, gain=GAIN):
-    """Amplify audio data by a gain factor"""
-    # Unpack 16-bit audio samples
-    samples = struct.unpack(f'<{len(audio_data)//2}h', audio_data)
-    # Amplify and clip to prevent overflow
-    amplified = []
-    for sample in samples:
-        new_sample = int(sample * gain)
-        # Clip to 16-bit range
-        new_sample = max(-32768, min(32767, new_sample))
-        amplified.append(new_sample)
-    # Pack back to bytes
-    return struct.pack(f'<{len(amplified)}h', *amplified)
+def align_speakers(words, reference, tolerance=0.25):
+    """Renumber speaker tags in words to match the tags reference used for the same audio"""
+    # Each recognize call numbers speakers independently; words recognized twice
+    # in the overlapping audio vote on which earlier tag each new tag stands for
+    votes = {}
+    ri = 0
+    for start, speaker in words:
+        while ri < len(reference) and reference[ri][0] < start - tolerance:
+            ri += 1
+        if ri == len(reference):
+            break
+        if abs(reference[ri][0] - start) <= tolerance:
+            speaker_votes = votes.setdefault(speaker, {})
+            ref_speaker = reference[ri][1]
+            speaker_votes[ref_speaker] = speaker_votes.get(ref_speaker, 0) + 1
+    mapping = {tag: max(counts, key=counts.get) for tag, counts in votes.items()}
+    
+    # Tags without overlap keep their number, or take the lowest free one if
+    # another tag was mapped onto it
+    used = set(mapping.values())
+    for tag in sorted({speaker for _, speaker in words} - set(mapping)):
+        new_tag = tag
+        if new_tag in used:
+            new_tag = 1
+            while new_tag in used:
+                new_tag += 1
+        mapping[tag] = new_tag
+        used.add(new_tag)
+    return [(start, mapping[speaker]) for start, speaker in words]
 
 class MicrophoneStream:
     """Opens a recording stream as a generator yielding audio chunks."""
     
-    def __init__(self, rate=RATE, chunk=CHUNK, gain=GAIN):
+    def __init__(self, rate=RATE, chunk=CHUNK, gain=GAIN, tee=None):
         self._rate = rate
         self._chunk = chunk
         self._gain = gain
-        self._buff = queue.Queue()
+        # Optional callable that also receives every chunk from the audio callback
+        self._tee = tee
+        # Reused by every callback so amplification doesn't allocate per chunk
+        self._scratch = np.empty(chunk, dtype=np.int32)
+        self._out = np.empty(chunk, dtype=np.int16)
+        self._buff = queue.SimpleQueue()
         self.closed = True
 
     def __enter__(self):
@@ -104,9 +158,16 @@ class MicrophoneStream:
         self._audio_interface.terminate()
 
     def _fill_buffer(self, in_data, frame_count, time_info, status_flags):
-        # Amplify audio for better sensitivity to distant speakers
-        amplified = amplify_audio(in_data, self._gain)
-        self._buff.put(amplified)
+        # Amplify audio for better sensitivity to distant speakers; with a gain
+        # of 1.0 the PyAudio buffer is passed straight through without a copy
+        if self._gain != 1.0:
+            if frame_count > len(self._out):
+                self._scratch = np.empty(frame_count, dtype=np.int32)
+                self._out = np.empty(frame_count, dtype=np.int16)
+            in_data = amplify_audio(in_data, self._gain, self._scratch, self._out)
+        if self._tee:
+            self._tee(in_data)
+        self._buff.put(in_data)
         return None, pyaudio.paContinue
 
     def generator(self):
@@ -116,6 +177,8 @@ class MicrophoneStream:
                 return
             data = [chunk]
             
+            # Send any chunks that queued up meanwhile along with it. Each chunk
+            # is already 100 ms, so waiting for more would only add latency.
             while True:
                 try:
                     chunk = self._buff.get(block=False)
@@ -128,32 +191,7 @@ class MicrophoneStream:
             yield b"".join(data)
 
 
-class StreamingCaptionApp:
-    def __init__(self):
-        self.app = Flask(__name__)
-        self.app.config['SECRET_KEY'] = 'caption-app-secret'
-        self.socketio = SocketIO(self.app, cors_allowed_origins="*")
-        
-        self.is_running = False
-        self.stream_thread = None
-        self.diarization_thread = None
-        
-        # Audio buffer for diarization
-        self.audio_buffer = []
-        self.transcript_buffer = []  # Store transcripts with timestamps
-        self.caption_id = 0
-        
-        # Speaker tracking
-        self.last_speaker = None
-        self.speaker_colors = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6']
-        self.speaker_names = ['Speaker 1', 'Speaker 2', 'Speaker 3', 'Speaker 4', 'Speaker 5']
-        
-        self.setup_routes()
-        
-    def setup_routes(self):
-        @self.app.route('/')
-        def index():
-            return render_template_string('''
+INDEX_HTML = '''
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -333,7 +371,80 @@ class StreamingCaptionApp:
     </script>
 </body>
 </html>
-            ''')
+'''
+
+# The page is static, so compile it once instead of on every request
+INDEX_TEMPLATE = Template(INDEX_HTML)
+
+
+class StreamingCaptionApp:
+    def __init__(self):
+        self.app = Flask(__name__)
+        self.app.config['SECRET_KEY'] = 'caption-app-secret'
+        # Threading mode: gRPC streaming does not work under eventlet monkey-patching.
+        # With simple-websocket installed this still uses real WebSocket transport.
+        self.socketio = SocketIO(self.app, cors_allowed_origins="*", async_mode="threading")
+        
+        self.is_running = False
+        self.stream_thread = None
+        self.diarization_thread = None
+        
+        # Audio buffer for diarization, bounded to the diarization window
+        self.audio_buffer = bytearray()
+        self.transcript_buffer = []  # Store transcripts with timestamps
+        self.caption_id = 0
+        # Latest interim result not yet sent to the browser, see emit_interim()
+        self.pending_interim = None
+        self.last_interim_time = 0.0
+        self.interim_lock = threading.Lock()
+        
+        # Bytes streamed since start, so buffered audio maps onto stream time
+        self.audio_bytes_total = 0
+        self.audio_lock = threading.Lock()
+        
+        # Recognition configs never change, so build the protos once
+        self.streaming_config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=RATE,
+                language_code="en-US",
+                enable_automatic_punctuation=True,
+            ),
+            interim_results=True,
+        )
+        self.diarization_config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=RATE,
+            language_code="en-US",
+            enable_automatic_punctuation=True,
+            enable_word_time_offsets=True,
+            diarization_config=speech.SpeakerDiarizationConfig(
+                enable_speaker_diarization=True,
+                min_speaker_count=2,
+                max_speaker_count=2,
+            ),
+        )
+        
+        # Shared Speech client, created on first use so its gRPC channel and
+        # auth token are reused by streaming and diarization
+        self._speech_client = None
+        
+        # Speaker tracking
+        self.last_speaker = None
+        self.speaker_colors = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6']
+        self.speaker_names = ['Speaker 1', 'Speaker 2', 'Speaker 3', 'Speaker 4', 'Speaker 5']
+        
+        self.setup_routes()
+        
+    def _get_speech_client(self):
+        if self._speech_client is None:
+            self._speech_client = speech.SpeechClient(credentials=GOOGLE_CREDENTIALS)
+        return self._speech_client
+
+    def setup_routes(self):
+        @self.app.route('/')
+        def index():
+            return INDEX_TEMPLATE.render()
         
         @self.socketio.on('start')
         def handle_start():
@@ -352,7 +463,8 @@ class StreamingCaptionApp:
                 self.diarization_thread.join(timeout=1)
             
             self.is_running = True
-            self.audio_buffer = []
+            self.audio_buffer = bytearray()
+            self.audio_bytes_total = 0
             self.transcript_buffer = []
             self.caption_id = 0
             self.socketio.emit('status', {'status': 'Listening...'})
@@ -361,6 +473,8 @@ class StreamingCaptionApp:
             # Start diarization thread
             self.diarization_thread = threading.Thread(target=self.run_diarization, daemon=True)
             self.diarization_thread.start()
+            # Delivers the last interim result held back by the rate limit
+            self.socketio.start_background_task(self.flush_interims)
     
     def stop_streaming(self):
         self.is_running = False
@@ -372,34 +486,18 @@ class StreamingCaptionApp:
     def stream_audio(self):
         """Stream audio to Google Cloud Speech-to-Text"""
         try:
-            client = speech.SpeechClient()
-            
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=RATE,
-                language_code="en-US",
-                enable_automatic_punctuation=True,
-            )
-            
-            streaming_config = speech.StreamingRecognitionConfig(
-                config=config,
-                interim_results=True,
-            )
+            client = self._get_speech_client()
             
-            with MicrophoneStream(RATE, CHUNK) as stream:
+            with MicrophoneStream(RATE, CHUNK, tee=self.buffer_audio) as stream:
                 audio_generator = stream.generator()
-                
-                def audio_with_buffer():
-                    for content in audio_generator:
-                        self.audio_buffer.append(content)
-                        yield content
-                
                 requests = (
                     speech.StreamingRecognizeRequest(audio_content=content)
-                    for content in audio_with_buffer()
+                    for content in audio_generator
                 )
                 
-                responses = client.streaming_recognize(streaming_config, requests)
+                responses = client.streaming_recognize(self.streaming_config, requests)
+                # Stream time (seconds) where the next final transcript begins
+                last_result_end = 0.0
                 
                 for response in responses:
                     if not self.is_running:
@@ -417,15 +515,22 @@ class StreamingCaptionApp:
                     if result.is_final:
                         caption_id = self.caption_id
                         self.caption_id += 1
+                        result_end = result.result_end_time.total_seconds()
                         self.transcript_buffer.append({
                             'id': caption_id,
                             'text': transcript,
-                            'time': time.time()
+                            'time': time.time(),
+                            'start': last_result_end,
+                            'end': result_end
                         })
-                        self.socketio.emit('final', {'id': caption_id, 'text': transcript})
+                        last_result_end = result_end
+                        with self.interim_lock:
+                            # The final result supersedes any held-back interim
+                            self.pending_interim = None
+                            self.socketio.emit('final', {'id': caption_id, 'text': transcript})
                         print(f"Final [{caption_id}]: {transcript}")
                     else:
-                        self.socketio.emit('interim', {'text': transcript})
+                        self.emit_interim(transcript)
                         
         except Exception as e:
             print(f"Streaming error: {e}")
@@ -435,52 +540,90 @@ class StreamingCaptionApp:
         self.is_running = False
         self.socketio.emit('status', {'status': 'Stopped'})
     
+    def buffer_audio(self, content):
+        """Keep captured audio for diarization (runs on the PyAudio callback thread)"""
+        with self.audio_lock:
+            self.audio_buffer += content
+            self.audio_bytes_total += len(content)
+            # Drop audio older than the window; deleting from the front of a
+            # bytearray just advances its start, so this doesn't shift the data
+            excess = len(self.audio_buffer) - RATE * 2 * DIARIZATION_WINDOW
+            if excess > 0:
+                del self.audio_buffer[:excess]
+    
+    def emit_interim(self, transcript):
+        """Send an interim result, coalescing updates to one per INTERIM_INTERVAL"""
+        with self.interim_lock:
+            self.pending_interim = transcript
+            if time.monotonic() - self.last_interim_time >= INTERIM_INTERVAL:
+                self._send_pending_interim()
+    
+    def flush_interims(self):
+        """Periodically send any interim result held back by emit_interim"""
+        while self.is_running:
+            self.socketio.sleep(INTERIM_INTERVAL)
+            with self.interim_lock:
+                self._send_pending_interim()
+    
+    def _send_pending_interim(self):
+        # Caller holds interim_lock
+        if self.pending_interim is None:
+            return
+        self.socketio.emit('interim', {'text': self.pending_interim})
+        self.pending_interim = None
+        self.last_interim_time = time.monotonic()
+    
     def run_diarization(self):
-        """Run speaker diarization on buffered audio periodically"""
+        """Run speaker diarization on newly buffered audio periodically"""
         print("Diarization thread started")
-        processed_captions = set()
+        # Captions are diarized in order, so everything before this index is done
+        diar_cursor = 0
+        bytes_per_second = RATE * 2
+        # Stream position (bytes) up to which captions have been diarized, and the
+        # (start, speaker) words recognized in the overlap just before it
+        diarized_bytes = 0
+        overlap_words = []
         
         while self.is_running:
             time.sleep(5)  # Process every 5 seconds
             
+            # Forget captions whose audio has already left the buffer; ones never
+            # diarized (e.g. after failed requests) can no longer be, so they go too
+            cutoff = time.time() - DIARIZATION_WINDOW
+            stale = 0
+            while (stale < len(self.transcript_buffer)
+                   and self.transcript_buffer[stale]['time'] < cutoff):
+                stale += 1
+            del self.transcript_buffer[:stale]
+            diar_cursor = max(0, diar_cursor - stale)
+            
             # Need unprocessed captions
-            unprocessed = [t for t in self.transcript_buffer if t['id'] not in processed_captions]
+            unprocessed = self.transcript_buffer[diar_cursor:]
             if not unprocessed:
                 continue
                 
-            # Get all audio data collected so far, but limit to 50 seconds to avoid timeout
-            audio_data = b''.join(self.audio_buffer)
-            max_audio_bytes = RATE * 2 * 50  # 50 seconds max
-            if len(audio_data) > max_audio_bytes:
-                # Keep only the most recent 50 seconds
-                audio_data = audio_data[-max_audio_bytes:]
+            # Snapshot only audio not yet diarized, plus a short overlap with the
+            # previous slice, so each request stays small however long the session
+            audio_data = None
+            with self.audio_lock:
+                audio_end = self.audio_bytes_total
+                buffer_start = audio_end - len(self.audio_buffer)
+                if audio_end - diarized_bytes >= bytes_per_second * DIARIZATION_MIN_AUDIO:
+                    slice_start = max(diarized_bytes - bytes_per_second * DIARIZATION_OVERLAP, buffer_start)
+                    audio_data = bytes(memoryview(self.audio_buffer)[slice_start - buffer_start:])
             
-            # Need at least 10 seconds of audio for good diarization
-            if len(audio_data) < RATE * 2 * 10:
+            if audio_data is None:
                 print(f"Waiting for more audio for diarization...")
                 continue
             
             try:
                 print(f"Running diarization on {len(audio_data)} bytes of audio...")
-                client = speech.SpeechClient()
+                # Stream time of the first byte sent, to shift word offsets by
+                audio_start = slice_start / bytes_per_second
+                client = self._get_speech_client()
                 
                 audio = speech.RecognitionAudio(content=audio_data)
-                
-                diarization_config = speech.SpeakerDiarizationConfig(
-                    enable_speaker_diarization=True,
-                    min_speaker_count=2,
-                    max_speaker_count=2,
-                )
-                
-                config = speech.RecognitionConfig(
-                    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                    sample_rate_hertz=RATE,
-                    language_code="en-US",
-                    enable_automatic_punctuation=True,
-                    diarization_config=diarization_config,
-                )
-                
-                response = client.recognize(config=config, audio=audio)
+                response = client.recognize(config=self.diarization_config, audio=audio)
                 
                 if response.results:
                     result = response.results[-1]
@@ -488,51 +631,43 @@ class StreamingCaptionApp:
                         words = result.alternatives[0].words
                         print(f"Got {len(words)} words with speaker info")
                         
-                        # Build word sequence with speakers
-                        word_list = []
-                        for word_info in words:
-                            speaker = getattr(word_info, 'speaker_tag', 1)
-                            word_list.append({
-                                'word': word_info.word.lower(),
-                                'speaker': speaker
-                            })
+                        # Build word sequence with speakers on the stream timeline,
+                        # numbered consistently with the previous slice
+                        word_list = [
+                            (audio_start + word_info.start_time.total_seconds(),
+                             getattr(word_info, 'speaker_tag', 1))
+                            for word_info in words
+                        ]
+                        word_list = align_speakers(word_list, overlap_words)
                         
-                        # Match transcripts to word sequences
-                        word_idx = 0
-                        for item in self.transcript_buffer:
-                            if item['id'] in processed_captions:
+                        # Match transcripts to the words spoken during them
+                        speakers = match_speakers(unprocessed, word_list)
+                        for item in unprocessed:
+                            speaker = speakers.get(item['id'])
+                            if speaker is None:
                                 continue
-                                
-                            item_words = item['text'].lower().split()
-                            speaker_votes = {}
-                            
-                            # Find words from this transcript in the word list
-                            for iw in item_words:
-                                clean_iw = ''.join(c for c in iw if c.isalnum())
-                                if not clean_iw:
-                                    continue
-                                # Search nearby in word list
-                                for wi in range(max(0, word_idx-5), min(len(word_list), word_idx+20)):
-                                    if word_list[wi]['word'].startswith(clean_iw[:3]):
-                                        s = word_list[wi]['speaker']
-                                        speaker_votes[s] = speaker_votes.get(s, 0) + 1
-                                        word_idx = wi + 1
-                                        break
+                            color = self.speaker_colors[(speaker - 1) % len(self.speaker_colors)]
+                            name = self.speaker_names[(speaker - 1) % len(self.speaker_names)]
                             
-                            if speaker_votes:
-                                # Use most common speaker
-                                speaker = max(speaker_votes, key=speaker_votes.get)
-                                color = self.speaker_colors[(speaker - 1) % len(self.speaker_colors)]
-                                name = self.speaker_names[(speaker - 1) % len(self.speaker_names)]
-                                
-                                self.socketio.emit('speaker_update', {
-                                    'id': item['id'],
-                                    'speaker': speaker,
-                                    'color': color,
-                                    'name': name
-                                })
-                                print(f"{name} -> [{item['id']}]: {item['text'][:40]}...")
-                                processed_captions.add(item['id'])
+                            self.socketio.emit('speaker_update', {
+                                'id': item['id'],
+                                'speaker': speaker,
+                                'color': color,
+                                'name': name
+                            })
+                            print(f"{name} -> [{item['id']}]: {item['text'][:40]}...")
+                        
+                        # This slice is the only one covering these captions' audio
+                        diar_cursor += len(unprocessed)
+                        
+                        # Resume after the last captioned speech, so words not yet
+                        # in a final caption are diarized in full next time
+                        diarized_end = unprocessed[-1]['end']
+                        diarized_bytes = int(diarized_end * RATE) * 2
+                        overlap_words = [
+                            word for word in word_list
+                            if diarized_end - DIARIZATION_OVERLAP <= word[0] < diarized_end
+                        ]
                 else:
                     print("No diarization results returned")
                                         
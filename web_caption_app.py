@@ -8,27 +8,35 @@ Integrates Claude API for enhanced transcription accuracy.
 import speech_recognition as sr
 import threading
 import queue
+import collections
 import time
 import os
-import json
-import tempfile
+import hashlib
+import uuid
+import pyaudio
+import orjson
+from google.api_core import exceptions as google_exceptions
+from google.cloud import speech
+from google.oauth2 import service_account
 from anthropic import Anthropic
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+CLAUDE_MODEL = "claude-haiku-4-5"
+CORRECTION_PROMPT = ("Please correct any transcription errors in the user's text "
+                     "and return only the corrected version.")
+
 def setup_google_credentials():
-    """Create credentials file from environment variables"""
-    # Check if credentials are in env vars
+    """Build service account credentials from environment variables"""
     project_id = os.getenv('GOOGLE_PROJECT_ID')
     private_key = os.getenv('GOOGLE_PRIVATE_KEY')
     client_email = os.getenv('GOOGLE_CLIENT_EMAIL')
     
     if project_id and private_key and client_email:
-        # Create temporary credentials file
         creds = {
             "type": "service_account",
             "project_id": project_id,
@@ -37,54 +45,58 @@ def setup_google_credentials():
             "token_uri": "https://oauth2.googleapis.com/token"
         }
         
-        # Write to temp file
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-        json.dump(creds, temp_file)
-        temp_file.close()
-        
-        # Set environment variable for Google SDK
-        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = temp_file.name
-        print(f"Google credentials loaded from environment variables")
-        return True
-    return False
+        # Kept in memory, so the private key is never written to disk
+        credentials = service_account.Credentials.from_service_account_info(creds)
+        print("Google credentials loaded from environment variables")
+        return credentials
+    return None
 
-# Try to set up Google credentials
-setup_google_credentials()
+# Credentials for the Speech client; None falls back to the default lookup
+# (e.g. GOOGLE_APPLICATION_CREDENTIALS)
+GOOGLE_CREDENTIALS = setup_google_credentials()
 
-class WebCaptionApp:
-    def __init__(self):
-        # Initialize Flask app
-        self.app = Flask(__name__)
-        self.app.config['SECRET_KEY'] = 'caption-app-secret'
-        self.socketio = SocketIO(self.app, cors_allowed_origins="*")
-        
-        # Speech recognition setup
-        self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone()
-        
-        # Thread-safe queue for communication
-        self.text_queue = queue.Queue()
-        
-        # Claude client (will be initialized if API key is provided)
-        self.claude_client = None
-        self.use_claude = False
-        
-        # Audio processing thread
-        self.is_running = False
-        self.audio_thread = None
-        
-        # Setup routes and events
-        self.setup_routes()
-        
-        # Adjust for ambient noise
-        self.calibrate_microphone()
-        
-    def setup_routes(self):
-        """Setup Flask routes and SocketIO events"""
-        
-        @self.app.route('/')
-        def index():
-            return render_template_string('''
+# Audio parameters for Google Cloud streaming recognition
+RATE = 16000
+CHUNK = int(RATE / 50)  # 20ms frames keep capture latency low
+
+# Captions arriving within this window are sent to the browser in one frame
+CAPTION_BATCH_WINDOW = 0.02  # seconds
+CAPTION_BATCH_SIZE = 50
+# Most captions held for a client that hasn't acknowledged its last batch
+CLIENT_QUEUE_SIZE = 50
+
+# The Socket.IO client is served from ./static when a copy is present there,
+# saving the page an external round-trip before the first handshake; otherwise
+# it comes from the CDN. The file name is versioned, so browsers may cache it
+# for a year.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SOCKETIO_CLIENT = 'socket.io-4.0.1.min.js'
+SOCKETIO_CDN = 'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.min.js'
+STATIC_MAX_AGE = 365 * 24 * 3600  # seconds
+
+# Last formatted caption timestamp, as [epoch second, "HH:MM:SS"]
+_ts_cache = [0, '']
+
+def _ts():
+    """Current wall-clock time as HH:MM:SS, formatted at most once per second"""
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache[0] = now
+        _ts_cache[1] = time.strftime("%H:%M:%S", time.localtime(now))
+    return _ts_cache[1]
+
+class OrjsonWrapper:
+    """orjson behind the json.dumps/json.loads interface Socket.IO expects"""
+    
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode('utf-8')
+    
+    @staticmethod
+    def loads(data, *args, **kwargs):
+        return orjson.loads(data)
+
+INDEX_HTML = '''
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -190,7 +202,7 @@ class WebCaptionApp:
         </div>
     </div>
 
-    <script src="https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.0.1/socket.io.js"></script>
+    <script src="__SOCKETIO_SRC__"></script>
     <script>
         const socket = io();
         const toggleBtn = document.getElementById('toggleBtn');
@@ -198,18 +210,79 @@ class WebCaptionApp:
         const status = document.getElementById('status');
         const captionArea = document.getElementById('captionArea');
         
+        // Older captions are dropped so long sessions keep a bounded DOM
+        const MAX_CAPTIONS = 200;
+        
         let isRunning = false;
+        let currentDiv = null;
+        let currentId = null;
+        let pending = [];
+        let acks = [];
+        let scheduled = false;
         
-        // Socket events
-        socket.on('caption', function(data) {
-            const captionItem = document.createElement('div');
-            captionItem.className = 'caption-item';
-            captionItem.innerHTML = `
-                <div class="timestamp">[${data.timestamp}]</div>
-                <div>${data.text}</div>
-            `;
-            captionArea.appendChild(captionItem);
+        // Captions are applied once per animation frame, so a burst costs one reflow
+        function flush() {
+            const fragment = document.createDocumentFragment();
+            for (const data of pending) {
+                // Results for the utterance in progress rewrite its item in place
+                if (!currentDiv || data.utterance_id !== currentId) {
+                    currentDiv = document.createElement('div');
+                    currentDiv.className = 'caption-item';
+                    currentDiv.innerHTML = `
+                        <div class="timestamp">[${data.timestamp}]</div>
+                        <div class="text"></div>
+                    `;
+                    currentId = data.utterance_id;
+                    fragment.appendChild(currentDiv);
+                }
+                currentDiv.querySelector('.text').textContent = data.text;
+                // A final result closes the item; the next result starts a new one
+                if (data.is_final) {
+                    currentDiv = null;
+                    currentId = null;
+                }
+            }
+            captionArea.appendChild(fragment);
+            while (captionArea.childElementCount > MAX_CAPTIONS) {
+                captionArea.removeChild(captionArea.firstElementChild);
+            }
             captionArea.scrollTop = captionArea.scrollHeight;
+            pending = [];
+            scheduled = false;
+            // Acknowledge only what has been drawn. Hidden tabs pause animation
+            // frames, so they stop acknowledging and the server holds back
+            // their captions in its bounded queue instead.
+            const drawn = acks;
+            acks = [];
+            drawn.forEach(function(ack) { ack(); });
+        }
+        
+        // Socket events
+        function addCaption(data) {
+            // Only the latest interim result of an utterance needs drawing
+            const last = pending[pending.length - 1];
+            if (last && !last.is_final && last.utterance_id === data.utterance_id) {
+                pending.pop();
+            }
+            pending.push(data);
+        }
+        
+        // Acknowledging tells the server this client is ready for more captions
+        function receive(items, ack) {
+            items.forEach(addCaption);
+            if (ack) acks.push(ack);
+            if (!scheduled) {
+                scheduled = true;
+                requestAnimationFrame(flush);
+            }
+        }
+        
+        socket.on('caption', function(data, ack) {
+            receive([data], ack);
+        });
+        
+        socket.on('caption_batch', function(items, ack) {
+            receive(items, ack);
         });
         
         socket.on('status', function(data) {
@@ -233,12 +306,110 @@ class WebCaptionApp:
         
         clearBtn.addEventListener('click', function() {
             captionArea.innerHTML = '';
+            pending = [];
+            currentDiv = null;
+            currentId = null;
             socket.emit('clear');
         });
     </script>
 </body>
 </html>
-            ''')
+'''
+
+# The client URL is fixed at startup, so substitute it and encode the page once
+if os.path.exists(os.path.join(STATIC_DIR, SOCKETIO_CLIENT)):
+    SOCKETIO_SRC = f'/static/{SOCKETIO_CLIENT}'
+else:
+    SOCKETIO_SRC = SOCKETIO_CDN
+INDEX_BYTES = INDEX_HTML.replace('__SOCKETIO_SRC__', SOCKETIO_SRC).encode('utf-8')
+INDEX_ETAG = hashlib.sha1(INDEX_BYTES).hexdigest()
+
+class WebCaptionApp:
+    def __init__(self):
+        # Initialize Flask app
+        self.app = Flask(__name__, static_folder=STATIC_DIR)
+        self.app.config['SECRET_KEY'] = 'caption-app-secret'
+        self.app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+        # Threading mode: gRPC streaming and the blocking caption queue need real
+        # threads, which eventlet monkey-patching would break. With simple-websocket
+        # installed this still uses real WebSocket transport.
+        # Short ping settings prune dead clients quickly; captions are tiny, so
+        # incoming messages are capped well below the default
+        self.socketio = SocketIO(
+            self.app,
+            cors_allowed_origins="*",
+            async_mode="threading",
+            ping_timeout=5,
+            ping_interval=2,
+            max_http_buffer_size=64 * 1024,
+            json=OrjsonWrapper,
+        )
+        
+        # Speech recognition setup
+        self.recognizer = sr.Recognizer()
+        # Capture at the rate Google recognizes at, so each REST phrase is
+        # FLAC-encoded and uploaded at 16 kHz rather than the device's 44.1/48 kHz
+        self.microphone = sr.Microphone(sample_rate=RATE)
+        
+        # Stream to Google Cloud Speech-to-Text when credentials are available,
+        # otherwise fall back to SpeechRecognition's free Google endpoint
+        self.use_streaming = (GOOGLE_CREDENTIALS is not None
+                              or bool(os.getenv('GOOGLE_APPLICATION_CREDENTIALS')))
+        self.streaming_config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=RATE,
+                language_code="en-US",
+                enable_automatic_punctuation=True,
+            ),
+            interim_results=True,
+            single_utterance=False,
+        )
+        
+        # Created on first use and kept, so every streaming session shares one
+        # long-lived gRPC channel instead of a new TLS connection each time
+        self.speech_client = None
+        
+        # Thread-safe queue for communication, carrying {'text', 'is_final', 'utterance_id'} items
+        self.text_queue = queue.Queue()
+        
+        # Claude client (will be initialized if API key is provided)
+        self.claude_client = None
+        self.use_claude = False
+        
+        # Captions waiting for each connected client: sid -> {'pending', 'waiting'}.
+        # A client gets its next batch only after acknowledging the previous one.
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+        
+        # Audio processing thread
+        self.is_running = False
+        self.audio_thread = None
+        # The REST path calibrates inside its audio thread when a session starts
+        self._calibrated = False
+        
+        # Setup routes and events
+        self.setup_routes()
+        
+    def setup_routes(self):
+        """Setup Flask routes and SocketIO events"""
+        
+        @self.app.route('/')
+        def index():
+            # Served straight from the prebuilt bytes; browsers revalidate by ETag
+            response = Response(INDEX_BYTES, mimetype='text/html')
+            response.set_etag(INDEX_ETAG)
+            return response.make_conditional(request)
+        
+        @self.socketio.on('connect')
+        def handle_connect(auth=None):
+            with self.clients_lock:
+                self.clients[request.sid] = {'pending': collections.deque(), 'waiting': False}
+        
+        @self.socketio.on('disconnect')
+        def handle_disconnect():
+            with self.clients_lock:
+                self.clients.pop(request.sid, None)
         
         @self.socketio.on('start')
         def handle_start():
@@ -252,38 +423,116 @@ class WebCaptionApp:
         def handle_clear():
             self.clear_captions()
         
-        # Background thread to emit captions
+        # Background thread to emit captions as soon as they are queued,
+        # bundling bursts into one frame
         def emit_captions():
             while True:
-                try:
-                    text = self.text_queue.get_nowait()
-                    timestamp = time.strftime("%H:%M:%S")
-                    self.socketio.emit('caption', {'text': text, 'timestamp': timestamp})
-                except queue.Empty:
-                    pass
-                self.socketio.sleep(0.1)
+                items = [self.text_queue.get()]
+                deadline = time.monotonic() + CAPTION_BATCH_WINDOW
+                while len(items) < CAPTION_BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(self.text_queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                
+                timestamp = _ts()
+                captions = [
+                    {
+                        'text': item['text'],
+                        'timestamp': timestamp,
+                        'is_final': item['is_final'],
+                        'utterance_id': item['utterance_id'],
+                    }
+                    for item in items
+                ]
+                self.queue_captions(captions)
+                self.socketio.sleep(0)
         
         self.socketio.start_background_task(emit_captions)
         
-    def calibrate_microphone(self):
-        """Calibrate microphone for ambient noise"""
+    def queue_captions(self, captions):
+        """Add captions to every client's pending queue and send what each can take"""
+        with self.clients_lock:
+            for client in self.clients.values():
+                pending = client['pending']
+                for caption in captions:
+                    # A queued interim result is superseded by the next result
+                    # for the same utterance
+                    if (pending and not pending[-1]['is_final']
+                            and pending[-1]['utterance_id'] == caption['utterance_id']):
+                        pending.pop()
+                    pending.append(caption)
+                # A stalled client loses its oldest captions rather than growing memory
+                while len(pending) > CLIENT_QUEUE_SIZE:
+                    pending.popleft()
+            sids = list(self.clients)
+        for sid in sids:
+            self.send_pending(sid)
+            
+    def send_pending(self, sid):
+        """Send a client its pending captions unless it has a batch unacknowledged"""
+        with self.clients_lock:
+            client = self.clients.get(sid)
+            if not client or client['waiting'] or not client['pending']:
+                return
+            captions = list(client['pending'])
+            client['pending'].clear()
+            client['waiting'] = True
+        
+        def acknowledged(*args):
+            with self.clients_lock:
+                client = self.clients.get(sid)
+                if client:
+                    client['waiting'] = False
+            self.send_pending(sid)
+        
+        if len(captions) == 1:
+            self.socketio.emit('caption', captions[0], to=sid, callback=acknowledged)
+        else:
+            self.socketio.emit('caption_batch', captions, to=sid, callback=acknowledged)
+            
+    def post_caption(self, text, is_final=True, utterance_id=None):
+        """Queue a caption for display; without an id it is an utterance of its own"""
+        self.text_queue.put({
+            'text': text,
+            'is_final': is_final,
+            'utterance_id': utterance_id or uuid.uuid4().hex
+        })
+        
+    def calibrate_microphone(self, source):
+        """Calibrate the open microphone source for ambient noise"""
         print("Calibrating microphone...")
-        with self.microphone as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
-        # Wait longer before considering silence as end of phrase
-        self.recognizer.pause_threshold = 1.5  # seconds of silence before phrase ends
-        self.recognizer.non_speaking_duration = 0.5  # minimum silence length
+        # A short sample is enough; Google's endpointer does the fine work
+        self.recognizer.adjust_for_ambient_noise(source, duration=0.3)
+        # End phrases quickly; Google's endpointer copes with mid-sentence splits
+        self.recognizer.pause_threshold = 0.5  # seconds of silence before phrase ends
+        self.recognizer.non_speaking_duration = 0.2  # minimum silence length
+        # Keep a quiet room from setting the threshold low enough to trigger on noise
+        self.recognizer.energy_threshold = max(300, self.recognizer.energy_threshold)
+        self._calibrated = True
         print("Microphone calibrated")
         
     def start_captioning(self):
         """Start the captioning process"""
         if not self.is_running:
+            # Wait for the previous session's thread to let go of the microphone,
+            # so two sessions never capture at once and its exit can't stop this one
+            if self.audio_thread is not None and self.audio_thread.is_alive():
+                self.audio_thread.join(timeout=5)
+                if self.audio_thread.is_alive():
+                    self.socketio.emit('status', {'status': 'Still stopping, try again'})
+                    return
+            
             self.is_running = True
             self.socketio.emit('status', {'status': 'Listening...'})
+            self._calibrated = False
             
             # Start audio processing thread
-            self.audio_thread = threading.Thread(target=self.process_audio, daemon=True)
-            self.audio_thread.start()
+            target = self.stream_audio if self.use_streaming else self.process_audio
+            self.audio_thread = self.socketio.start_background_task(target)
             
     def stop_captioning(self):
         """Stop the captioning process"""
@@ -300,52 +549,147 @@ class WebCaptionApp:
         print("Audio processing started...")
         while self.is_running:
             try:
+                # Keep the microphone open across phrases so no audio is lost to
+                # reopening the stream; it is only reopened after a device error
                 with self.microphone as source:
-                    # Listen for audio - 6 seconds captures most sentences
-                    audio = self.recognizer.listen(source, timeout=2, phrase_time_limit=6)
-                    print(f"Audio captured, length: {len(audio.frame_data)} bytes")
-                    
-                # Recognize speech using Google's free API
-                try:
-                    print("Sending to Google Speech API...")
-                    text = self.recognizer.recognize_google(audio)
-                    print(f"Recognized: {text}")
-                    
-                    # Put text in queue immediately for real-time display
-                    self.text_queue.put(text)
+                    # Adjust for ambient noise once per session, off the server's
+                    # startup path; Google's streaming endpointer needs no local
+                    # energy threshold, so only this REST path is calibrated
+                    if not self._calibrated:
+                        self.calibrate_microphone(source)
+                    while self.is_running:
+                        try:
+                            # Listen for audio - short phrases keep each caption prompt
+                            audio = self.recognizer.listen(source, timeout=2, phrase_time_limit=3)
+                            print(f"Audio captured, length: {len(audio.frame_data)} bytes")
+                        except sr.WaitTimeoutError:
+                            # Timeout, continue listening
+                            print("Listening timeout, retrying...")
+                            continue
+                            
+                        # Recognize speech using Google's free API
+                        try:
+                            print("Sending to Google Speech API...")
+                            text = self.recognizer.recognize_google(audio)
+                            print(f"Recognized: {text}")
+                            
+                            # Put text in queue immediately for real-time display
+                            self.post_caption(text)
+                            
+                            # Note: Claude enhancement disabled for speed
+                            # To enable, uncomment below (adds ~1s delay per caption)
+                            # if self.use_claude and self.claude_client:
+                            #     enhanced_text = self.enhance_with_claude(text)
+                            #     if enhanced_text:
+                            #         self.post_caption(f"[Enhanced] {enhanced_text}")
+                            
+                        except sr.UnknownValueError:
+                            # Speech was unintelligible
+                            print("Could not understand audio")
+                        except sr.RequestError as e:
+                            # API error
+                            print(f"Google API error: {e}")
+                            self.post_caption(f"API Error: {e}")
                     
-                    # Note: Claude enhancement disabled for speed
-                    # To enable, uncomment below (adds ~1s delay per caption)
-                    # if self.use_claude and self.claude_client:
-                    #     enhanced_text = self.enhance_with_claude(text)
-                    #     if enhanced_text:
-                    #         self.text_queue.put(f"[Enhanced] {enhanced_text}")
-                    
-                except sr.UnknownValueError:
-                    # Speech was unintelligible
-                    print("Could not understand audio")
-                except sr.RequestError as e:
-                    # API error
-                    print(f"Google API error: {e}")
-                    self.text_queue.put(f"API Error: {e}")
-                    
-            except sr.WaitTimeoutError:
-                # Timeout, continue listening
-                print("Listening timeout, retrying...")
             except Exception as e:
-                # Other errors
+                # Other errors, e.g. the audio device going away; reopen after a pause
                 print(f"Error in audio processing: {e}")
-                self.text_queue.put(f"Error: {e}")
+                self.post_caption(f"Error: {e}")
+                time.sleep(1)
+                
+    def stream_audio(self):
+        """Stream microphone audio to Google Cloud Speech-to-Text in separate thread"""
+        print("Streaming recognition started...")
+        audio_queue = queue.SimpleQueue()
+        
+        def fill_queue(in_data, frame_count, time_info, status_flags):
+            audio_queue.put(in_data)
+            return None, pyaudio.paContinue
+        
+        def audio_requests():
+            # Frames are sent as they are captured, overlapping recording with upload
+            while self.is_running:
+                data = [audio_queue.get()]
+                while True:
+                    try:
+                        data.append(audio_queue.get(block=False))
+                    except queue.Empty:
+                        break
+                yield speech.StreamingRecognizeRequest(audio_content=b"".join(data))
+        
+        audio_interface = None
+        audio_stream = None
+        try:
+            audio_interface = pyaudio.PyAudio()
+            audio_stream = audio_interface.open(
+                format=pyaudio.paInt16,
+                channels=1,
+                rate=RATE,
+                input=True,
+                frames_per_buffer=CHUNK,
+                stream_callback=fill_queue,
+            )
+            if self.speech_client is None:
+                self.speech_client = speech.SpeechClient(credentials=GOOGLE_CREDENTIALS)
+            client = self.speech_client
+            # Interim and final results of one utterance share an id so the
+            # browser can rewrite that caption in place
+            utterance_id = uuid.uuid4().hex
+            interim_text = None
+            while self.is_running:
+                try:
+                    responses = client.streaming_recognize(self.streaming_config, audio_requests())
+                    for response in responses:
+                        if not self.is_running:
+                            break
+                        if not response.results or not response.results[0].alternatives:
+                            continue
+                        result = response.results[0]
+                        transcript = result.alternatives[0].transcript
+                        self.post_caption(transcript, result.is_final, utterance_id)
+                        if result.is_final:
+                            utterance_id = uuid.uuid4().hex
+                            interim_text = None
+                        else:
+                            interim_text = transcript
+                except google_exceptions.OutOfRange:
+                    # Streams are capped at a few minutes; start a new one. The cut-off
+                    # utterance keeps its last interim text rather than being
+                    # overwritten by the new stream's results.
+                    print("Stream duration limit reached, restarting...")
+                    if interim_text is not None:
+                        self.post_caption(interim_text, True, utterance_id)
+                        interim_text = None
+                    utterance_id = uuid.uuid4().hex
+        except Exception as e:
+            print(f"Error in streaming recognition: {e}")
+            self.post_caption(f"Error: {e}")
+        finally:
+            if audio_stream is not None:
+                audio_stream.stop_stream()
+                audio_stream.close()
+            if audio_interface is not None:
+                audio_interface.terminate()
+        
+        # Whether stopped or failed, the session is over; let Start work again
+        self.is_running = False
+        self.socketio.emit('status', {'status': 'Stopped'})
                 
     def enhance_with_claude(self, text):
         """Enhance transcription using Claude API"""
         try:
             message = self.claude_client.messages.create(
-                model="claude-haiku-4-5-20250214",
+                model=CLAUDE_MODEL,
                 max_tokens=100,
+                # The fixed instruction is a stable prefix Claude can cache across calls
+                system=[{
+                    "type": "text",
+                    "text": CORRECTION_PROMPT,
+                    "cache_control": {"type": "ephemeral"}
+                }],
                 messages=[{
                     "role": "user",
-                    "content": f"Please correct any transcription errors in this text and return only the corrected version: {text}"
+                    "content": text
                 }]
             )
             return message.content[0].text.strip()
@@ -373,8 +717,13 @@ class WebCaptionApp:
             print("ANTHROPIC_API_KEY environment variable not found. Running without Claude enhancement.")
             
         print(f"Starting web captioning app at http://{host}:{port}")
-        self.socketio.run(self.app, host=host, port=port, debug=debug)
+        # The reloader would import the app a second time, opening the microphone
+        # and starting the caption emitter twice. Werkzeug's threaded server is
+        # fine for this single-machine app, so allow it outside a terminal too.
+        self.socketio.run(self.app, host=host, port=port, debug=debug,
+                          use_reloader=False, allow_unsafe_werkzeug=True)
 
 if __name__ == "__main__":
     app = WebCaptionApp()
-    app.run(port=5050, debug=True)
+    # Debug mode is opt-in (FLASK_DEBUG=1) rather than always on
+    app.run(port=5050, debug=os.getenv('FLASK_DEBUG') == '1')